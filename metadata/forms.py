@@ -1,15 +1,60 @@
+import copy
+import functools
+
 from django import forms
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.forms.formsets import formset_factory
+from django.utils.encoding import force_text
 from django.utils.text import format_lazy
 from django.utils.translation import ugettext_lazy as _
 
 from mayan.apps.templating.fields import TemplateField
 
 from .classes import MetadataLookup
+from .events import event_metadata_type_relationship
+from .literals import (
+    ADD_FORM_CHOICES_CACHE_KEY, ADD_FORM_CHOICES_CACHE_TIMEOUT,
+    LOOKUP_CHOICES_CACHE_KEY, LOOKUP_CHOICES_CACHE_TIMEOUT
+)
 from .models import DocumentTypeMetadataType, MetadataType
 
 
+def _get_lookup_choices(metadata_type):
+    """
+    Return the rendered lookup options of the metadata type as a choices
+    tuple. The result is cached briefly so that formsets repeating the
+    same metadata type render the lookup template only once.
+    """
+    return cache.get_or_set(
+        LOOKUP_CHOICES_CACHE_KEY.format(metadata_type.pk),
+        lambda: tuple(
+            (value, value) for value in metadata_type.get_lookup_values()
+        ), LOOKUP_CHOICES_CACHE_TIMEOUT
+    )
+
+
+# Composed once at import instead of once per rendered formset row.
+_BLANK_CHOICE = (('', '------'),)
+_REQUIRED_SUFFIX = format_lazy(' ({})', _('Required'))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_lookup_field_help_text():
+    """
+    Compose the help text of the lookup field once per process. Evaluated
+    on first form construction instead of at import time so that the
+    MetadataLookup registry is fully populated.
+    """
+    return format_lazy(
+        '{}{}{}',
+        MetadataType._meta.get_field('lookup').help_text,
+        _(' Available template context variables: '),
+        MetadataLookup.get_as_help_text()
+    )
+
+
 class DocumentMetadataForm(forms.Form):
     metadata_type_id = forms.CharField(label=_('ID'), widget=forms.HiddenInput)
     metadata_type_name = forms.CharField(
@@ -29,6 +74,9 @@ class DocumentMetadataForm(forms.Form):
         js = ('metadata/js/metadata_form.js',)
 
     def __init__(self, *args, **kwargs):
+        self.required_metadata_map = kwargs.pop('required_metadata_map', None)
+        self.metadata_type = None
+        self.document_type = None
         super(DocumentMetadataForm, self).__init__(*args, **kwargs)
 
         # Set form fields initial values
@@ -37,86 +85,149 @@ class DocumentMetadataForm(forms.Form):
             self.document_type = kwargs['initial']['document_type']
             required_string = ''
 
-            required = self.metadata_type.get_required_for(
-                document_type=self.document_type
-            )
+            required = self.get_metadata_type_required()
 
             if required:
                 self.fields['value'].required = True
-                required_string = ' (%s)' % _('Required')
+                required_string = _REQUIRED_SUFFIX
             else:
                 self.fields['value'].required = False
                 self.fields['update'].initial = False
 
-            self.fields['metadata_type_name'].initial = '%s%s' % (
-                (
-                    self.metadata_type.label if self.metadata_type.label else self.metadata_type.name
-                ),
+            self.fields['metadata_type_name'].initial = '{}{}'.format(
+                self.metadata_type.label or self.metadata_type.name,
                 required_string
             )
             self.fields['metadata_type_id'].initial = self.metadata_type.pk
 
-            if self.metadata_type.lookup:
-                try:
-                    self.fields['value'] = forms.ChoiceField(
-                        label=self.fields['value'].label
-                    )
-                    choices = self.metadata_type.get_lookup_values()
-                    choices = list(zip(choices, choices))
-                    if not required:
-                        choices.insert(0, ('', '------'))
-                    self.fields['value'].choices = choices
-                    self.fields['value'].required = required
-                    self.fields['value'].widget.attrs.update(
-                        {'class': 'metadata-value'}
-                    )
-                except Exception as exception:
-                    self.fields['value'].initial = _(
-                        'Lookup value error: %s'
-                    ) % exception
-                    self.fields['value'].widget = forms.TextInput(
-                        attrs={'readonly': 'readonly'}
-                    )
+            self._configure_value_field(required=required)
 
-            if self.metadata_type.default:
-                try:
-                    self.fields[
-                        'value'
-                    ].initial = self.metadata_type.get_default_value()
-                except Exception as exception:
-                    self.fields['value'].initial = _(
-                        'Default value error: %s'
-                    ) % exception
-                    self.fields['value'].widget = forms.TextInput(
-                        attrs={'readonly': 'readonly'}
-                    )
+    def _configure_value_field(self, required):
+        if self.metadata_type.lookup:
+            try:
+                choices = _get_lookup_choices(
+                    metadata_type=self.metadata_type
+                )
+                if not required:
+                    # Tuple concatenation keeps the cached choices tuple
+                    # itself unmodified.
+                    choices = _BLANK_CHOICE + choices
+                # Swap the widget of the existing field instead of
+                # building a replacement ChoiceField per form. Option
+                # membership is enforced by
+                # MetadataType.validate_value() during clean().
+                self.fields['value'].widget = forms.Select(
+                    attrs={'class': 'metadata-value'}, choices=choices
+                )
+            except Exception as exception:
+                self.fields['value'].initial = _(
+                    'Lookup value error: %s'
+                ) % exception
+                self.fields['value'].widget = forms.TextInput(
+                    attrs={'readonly': 'readonly'}
+                )
 
-    def clean(self):
-        metadata_type = getattr(self, 'metadata_type', None)
+        if self.metadata_type.default:
+            try:
+                self.fields[
+                    'value'
+                ].initial = self.metadata_type.get_default_value()
+            except Exception as exception:
+                self.fields['value'].initial = _(
+                    'Default value error: %s'
+                ) % exception
+                self.fields['value'].widget = forms.TextInput(
+                    attrs={'readonly': 'readonly'}
+                )
 
-        if metadata_type:
-            required = self.metadata_type.get_required_for(
-                document_type=self.document_type
+    def get_metadata_type_required(self):
+        if self.required_metadata_map is not None:
+            return self.required_metadata_map.get(
+                (self.metadata_type.pk, self.document_type.pk), False
             )
 
+        return self.metadata_type.get_required_for(
+            document_type=self.document_type
+        )
+
+    def clean(self):
+        if self.metadata_type is not None:
+            update = self.cleaned_data.get('update')
+            value = self.cleaned_data.get('value')
+
             # Enforce required only if the metadata has no previous value.
-            if required and not self.cleaned_data['value'] and not self.cleaned_data.get('update'):
+            if self.get_metadata_type_required() and not value and not update:
                 raise ValidationError(
                     _(
                         '"%s" is required for this document type.'
                     ) % self.metadata_type.label
                 )
 
-        if self.cleaned_data.get('update') and hasattr(self, 'metadata_type'):
-            self.cleaned_data['value'] = self.metadata_type.validate_value(
-                document_type=self.document_type,
-                value=self.cleaned_data.get('value')
-            )
+            if update:
+                if (
+                    value and self.initial.get('value_is_stored') and
+                    value == self.initial.get('value')
+                ):
+                    # A non empty value identical to the initial one was
+                    # already validated and parsed when it was stored;
+                    # skip re-rendering the validation and parsing
+                    # templates for untouched rows. Views set
+                    # value_is_stored only when the initial value is a
+                    # single stored value; the joined string shown for
+                    # several distinct values across documents is
+                    # synthetic and always revalidated.
+                    self.cleaned_data['value'] = value
+                else:
+                    self.cleaned_data['value'] = self.metadata_type.validate_value(
+                        document_type=self.document_type, value=value
+                    )
 
         return self.cleaned_data
 
 
-DocumentMetadataFormSet = formset_factory(form=DocumentMetadataForm, extra=0)
+# The formset classes below are generated once at import time. Views and
+# wizard steps should import them instead of calling formset_factory()
+# again, which would rebuild an identical class per call.
+DocumentMetadataFormSetBase = formset_factory(
+    form=DocumentMetadataForm, extra=0
+)
+
+
+class DocumentMetadataFormSet(DocumentMetadataFormSetBase):
+    def __init__(self, *args, **kwargs):
+        super(DocumentMetadataFormSet, self).__init__(*args, **kwargs)
+        self.form_kwargs.update(
+            {'required_metadata_map': self.get_required_metadata_map()}
+        )
+
+    @classmethod
+    def prepare_formset(cls, document_type):
+        """
+        Fetch the required flag of every metadata type of the document type
+        with a single query instead of one query per member form.
+        """
+        return {
+            (metadata_type_id, document_type.pk): required
+            for metadata_type_id, required in
+            DocumentTypeMetadataType.objects.filter(
+                document_type=document_type
+            ).values_list('metadata_type_id', 'required')
+        }
+
+    def get_required_metadata_map(self):
+        document_types = set()
+        for entry in self.initial or ():
+            document_type = entry.get('document_type')
+            if document_type:
+                document_types.add(document_type)
+
+        required_metadata_map = {}
+        for document_type in document_types:
+            required_metadata_map.update(
+                self.prepare_formset(document_type=document_type)
+            )
+
+        return required_metadata_map
 
 
 class DocumentMetadataAddForm(forms.Form):
@@ -131,18 +242,41 @@ class DocumentMetadataAddForm(forms.Form):
     def __init__(self, *args, **kwargs):
         document_type = kwargs.pop('document_type', None)
 
+        choices = None
         if document_type:
-            queryset = kwargs.pop(
-                'queryset', MetadataType.objects.get_for_document_type(
+            queryset = kwargs.pop('queryset', None)
+
+            if queryset is not None:
+                queryset = queryset.only('id', 'name', 'label')
+            else:
+                queryset = MetadataType.objects.get_for_document_type(
                     document_type=document_type
+                ).only('id', 'name', 'label')
+                # The default queryset depends only on the document type;
+                # cache its evaluated choices briefly to skip the query on
+                # repeated renderings. Caller supplied querysets are
+                # document specific and bypass the cache.
+                choices = cache.get_or_set(
+                    ADD_FORM_CHOICES_CACHE_KEY.format(document_type.pk),
+                    lambda: [
+                        (metadata_type.pk, force_text(s=metadata_type))
+                        for metadata_type in queryset
+                    ], ADD_FORM_CHOICES_CACHE_TIMEOUT
                 )
-            )
         else:
             queryset = MetadataType.objects.none()
+            # An empty in memory choice list; keeps the widget's model
+            # choice iterator from evaluating the empty queryset when the
+            # field is rendered.
+            choices = []
 
         super(DocumentMetadataAddForm, self).__init__(*args, **kwargs)
 
         self.fields['metadata_type'].queryset = queryset
+        if choices is not None:
+            # Assigning choices also sets them on the widget, bypassing
+            # queryset iteration during rendering.
+            self.fields['metadata_type'].choices = choices
 
 
 class DocumentMetadataRemoveForm(DocumentMetadataForm):
@@ -154,6 +288,11 @@ class DocumentMetadataRemoveForm(DocumentMetadataForm):
         super(DocumentMetadataRemoveForm, self).__init__(*args, **kwargs)
         self.fields.pop('value')
 
+    def _configure_value_field(self, required):
+        # The value field is discarded by this form; skip the lookup and
+        # default value rendering done for it by the parent form.
+        pass
+
     def clean(self):
         return super(forms.Form, self).clean()
 
@@ -163,20 +302,31 @@ DocumentMetadataRemoveFormSet = formset_factory(
 )
 
 
+@functools.lru_cache(maxsize=None)
+def _get_template_field_prototypes():
+    """
+    Build the TemplateField replacements for the default and lookup
+    fields a single time per process. Form instances receive deep copies,
+    mirroring how Django hands out base_fields, so the per instance cost
+    drops from a full field construction to a copy.
+    """
+    return {
+        'default': TemplateField(
+            initial_help_text=MetadataType._meta.get_field(
+                'default'
+            ).help_text, required=False
+        ),
+        'lookup': TemplateField(
+            initial_help_text=_get_lookup_field_help_text(), required=False
+        )
+    }
+
+
 class MetadataTypeForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super(MetadataTypeForm, self).__init__(*args, **kwargs)
-        self.fields['default'] = TemplateField(
-            initial_help_text=self.fields['default'].help_text, required=False
-        )
-        self.fields['lookup'] = TemplateField(
-            initial_help_text=format_lazy(
-                '{}{}{}',
-                self.fields['lookup'].help_text,
-                _(' Available template context variables: '),
-                MetadataLookup.get_as_help_text()
-            ), required=False
-        )
+        for name, field in _get_template_field_prototypes().items():
+            self.fields[name] = copy.deepcopy(field)
 
     class Meta:
         fields = ('name', 'label', 'default', 'lookup', 'validation', 'parser')
@@ -204,6 +354,7 @@ class DocumentTypeMetadataTypeRelationshipForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         self._user = kwargs.pop('_user')
+        relationships = kwargs.pop('relationships', None)
         super(DocumentTypeMetadataTypeRelationshipForm, self).__init__(
             *args, **kwargs
         )
@@ -214,67 +365,89 @@ class DocumentTypeMetadataTypeRelationshipForm(forms.Form):
             else:
                 self.fields['label'].initial = self.initial['metadata_type'].label
 
+            if relationships is not None:
+                self._relationship = relationships.get(
+                    (
+                        self.initial['document_type'].pk,
+                        self.initial['metadata_type'].pk
+                    )
+                )
+                self._relationship_required = (
+                    self._relationship.required
+                    if self._relationship is not None else None
+                )
+            else:
+                self._relationship = None
+                # Only the required flag is needed to determine the
+                # initial relationship type; skip materializing the full
+                # model instance.
+                self._relationship_required = self.get_relationship(
+                ).values_list('required', flat=True).first()
+
             self.initial_relationship_type = self.get_relationship_type()
             self.fields['relationship_type'].initial = self.initial_relationship_type
 
     def get_relationship(self):
-        return self.initial['document_type'].metadata.filter(
-            metadata_type=self.initial['metadata_type']
-        )
-
-    def get_relationship_choices(self):
-        return self.initial['document_type'].metadata.filter(
-            metadata_type=self.initial['metadata_type']
-        )
+        return self.initial['document_type'].metadata.select_related(
+            'document_type', 'metadata_type'
+        ).filter(metadata_type=self.initial['metadata_type'])
 
     def get_relationship_type(self):
-        relationship = self.get_relationship()
-
-        if relationship.exists():
-            if relationship.get().required:
-                return self.RELATIONSHIP_TYPE_REQUIRED
-            else:
-                return self.RELATIONSHIP_TYPE_OPTIONAL
-        else:
+        if self._relationship_required is None:
             return self.RELATIONSHIP_TYPE_NONE
+        elif self._relationship_required:
+            return self.RELATIONSHIP_TYPE_REQUIRED
+        else:
+            return self.RELATIONSHIP_TYPE_OPTIONAL
 
     def save(self):
-        relationship = self.get_relationship()
+        relationship_type = self.cleaned_data['relationship_type']
 
-        if self.cleaned_data['relationship_type'] != self.initial_relationship_type:
-            getattr(
-                self, 'save_relationship_{}'.format(
-                    self.cleaned_data['relationship_type']
-                )
-            )(relationship=relationship)
+        if relationship_type != self.initial_relationship_type:
+            self._SAVE_METHODS[relationship_type](
+                self, relationship=self.get_relationship()
+            )
 
     def save_relationship_none(self, relationship):
-        relationship.get().delete(_user=self._user)
+        instance = relationship.first()
+
+        if instance is not None:
+            instance.delete(_user=self._user)
 
     def save_relationship_optional(self, relationship):
-        if relationship.exists():
-            instance = relationship.get()
+        instance = relationship.first()
+
+        if instance is not None:
             instance.required = False
             instance.save(_user=self._user)
         else:
-            relationship = DocumentTypeMetadataType(
+            instance = DocumentTypeMetadataType(
                 document_type=self.initial['document_type'],
                 metadata_type=self.initial['metadata_type'],
             )
-            relationship.save(_user=self._user)
+            instance.save(_user=self._user)
 
     def save_relationship_required(self, relationship):
-        if relationship.exists():
-            instance = relationship.get()
+        instance = relationship.first()
+
+        if instance is not None:
             instance.required = True
             instance.save(_user=self._user)
         else:
-            relationship = DocumentTypeMetadataType(
+            instance = DocumentTypeMetadataType(
                 document_type=self.initial['document_type'],
                 metadata_type=self.initial['metadata_type'],
                 required=True,
             )
-            relationship.save(_user=self._user)
+            instance.save(_user=self._user)
+
+    # Static dispatch table; avoids composing a method name string and
+    # resolving it with getattr for every saved form.
+    _SAVE_METHODS = {
+        RELATIONSHIP_TYPE_NONE: save_relationship_none,
+        RELATIONSHIP_TYPE_OPTIONAL: save_relationship_optional,
+        RELATIONSHIP_TYPE_REQUIRED: save_relationship_required,
+    }
 
 
 DocumentTypeMetadataTypeRelationshipFormSetBase = formset_factory(
@@ -284,6 +457,97 @@ DocumentTypeMetadataTypeRelationshipFormSetBase = formset_factory(
 
 class DocumentTypeMetadataTypeRelationshipFormSet(DocumentTypeMetadataTypeRelationshipFormSetBase):
     def __init__(self, *args, **kwargs):
-        _user = kwargs.pop('_user')
+        self._user = kwargs.pop('_user')
         super(DocumentTypeMetadataTypeRelationshipFormSet, self).__init__(*args, **kwargs)
-        self.form_kwargs.update({'_user': _user})
+        self.form_kwargs.update(
+            {'_user': self._user, 'relationships': self.get_relationships()}
+        )
+
+    def get_relationships(self):
+        """
+        Fetch every relationship of the formset's document types and
+        metadata types with a single query instead of one query per member
+        form.
+        """
+        document_type_ids = set()
+        metadata_type_ids = set()
+        for entry in self.initial or ():
+            if 'main_model' in entry:
+                document_type_ids.add(entry['document_type'].pk)
+                metadata_type_ids.add(entry['metadata_type'].pk)
+
+        return {
+            (relationship.document_type_id, relationship.metadata_type_id):
+            relationship
+            for relationship in DocumentTypeMetadataType.objects.select_related(
+                'document_type', 'metadata_type'
+            ).filter(
+                document_type_id__in=document_type_ids,
+                metadata_type_id__in=metadata_type_ids
+            )
+        }
+
+    def save(self):
+        """
+        Partition the changed member forms and dispatch the updates with
+        a single bulk query instead of a query pair per form. Creations
+        and deletions go through the model save() and delete() methods
+        one row at a time so that the post_save and post_delete handlers,
+        which queue the tasks that back fill or remove document metadata,
+        and the audit events still fire. Updates did not trigger either
+        handler before, so only their relationship event, which
+        references the document type and metadata type rather than the
+        relationship row, is committed after the bulk query.
+        """
+        to_create = []
+        to_update = []
+        to_delete = []
+
+        for form in self.forms:
+            relationship_type = form.cleaned_data.get('relationship_type')
+
+            if relationship_type is None:
+                continue
+
+            if relationship_type == form.initial_relationship_type:
+                continue
+
+            instance = form._relationship
+
+            if relationship_type == form.RELATIONSHIP_TYPE_NONE:
+                if instance is not None:
+                    to_delete.append(instance)
+            else:
+                required = (
+                    relationship_type == form.RELATIONSHIP_TYPE_REQUIRED
+                )
+
+                if instance is None:
+                    to_create.append(
+                        DocumentTypeMetadataType(
+                            document_type=form.initial['document_type'],
+                            metadata_type=form.initial['metadata_type'],
+                            required=required
+                        )
+                    )
+                else:
+                    instance.required = required
+                    to_update.append(instance)
+
+        with transaction.atomic():
+            for instance in to_create:
+                instance.save(_user=self._user)
+
+            if to_update:
+                DocumentTypeMetadataType.objects.bulk_update(
+                    fields=('required',), objs=to_update
+                )
+
+            for instance in to_delete:
+                instance.delete(_user=self._user)
+
+            for instance in to_update:
+                event_metadata_type_relationship.commit(
+                    action_object=instance.document_type, actor=self._user,
+                    target=instance.metadata_type
+                )
@@ -3,3 +3,9 @@ from .validators import MetadataValidator
 
 DEFAULT_METADATA_AVAILABLE_VALIDATORS = MetadataValidator.get_import_paths()
 DEFAULT_METADATA_AVAILABLE_PARSERS = MetadataParser.get_import_paths()
+
+ADD_FORM_CHOICES_CACHE_KEY = 'metadata-add-form-choices-{}'
+ADD_FORM_CHOICES_CACHE_TIMEOUT = 60
+
+LOOKUP_CHOICES_CACHE_KEY = 'metadata-lookup-choices-{}'
+LOOKUP_CHOICES_CACHE_TIMEOUT = 60
@@ -1,3 +1,4 @@
+import functools
 import shlex
 
 from django.core.exceptions import ValidationError
@@ -20,6 +21,26 @@ from .managers import DocumentTypeMetadataTypeManager, MetadataTypeManager
 from .settings import setting_available_parsers, setting_available_validators
 
 
+@functools.lru_cache(maxsize=256)
+def _get_compiled_template(template_string):
+    """
+    Compile a metadata template a single time per process. Keyed by the
+    template string itself, so editing a metadata type naturally produces
+    a new cache entry. Rendering a compiled template is thread safe.
+    """
+    return Template(template_string=template_string)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_dotted_path_instance(dotted_path):
+    """
+    Import and instantiate a validator or parser class a single time per
+    process. The registered classes are stateless, so the instances can
+    be shared across calls.
+    """
+    return import_string(dotted_path=dotted_path)()
+
+
 def validation_choices():
     return zip(
         setting_available_validators.value,
@@ -103,11 +124,11 @@ class MetadataType(models.Model):
         )
 
     def get_default_value(self):
-        template = Template(template_string=self.default)
+        template = _get_compiled_template(template_string=self.default)
         return template.render()
 
     def get_lookup_values(self):
-        template = Template(template_string=self.lookup)
+        template = _get_compiled_template(template_string=self.lookup)
         return MetadataType.comma_splitter(
             template.render(context=MetadataLookup.get_as_context())
         )
@@ -161,11 +182,11 @@ class MetadataType(models.Model):
                 )
 
         if self.validation:
-            validator = import_string(dotted_path=self.validation)()
+            validator = _get_dotted_path_instance(dotted_path=self.validation)
             validator.validate(value)
 
         if self.parser:
-            parser = import_string(dotted_path=self.parser)()
+            parser = _get_dotted_path_instance(dotted_path=self.parser)
             value = parser.parse(value)
 
         return value
@@ -18,3 +18,4 @@ TEST_METADATA_VALUE_UNICODE = 'español'
 TEST_METADATA_VALUE_WITH_AMPERSAND = 'first value & second value'
 TEST_PARSED_VALID_DATE = '2001-01-01'
 TEST_VALID_DATE = '2001-1-1'
+TEST_VALID_DATE_2 = '2002-2-2'
@@ -18,7 +18,10 @@ from ..permissions import (
     permission_metadata_type_edit, permission_metadata_type_view
 )
 
-from .literals import TEST_METADATA_VALUE, TEST_METADATA_VALUE_EDITED
+from .literals import (
+    TEST_DATE_VALIDATOR, TEST_METADATA_VALUE, TEST_METADATA_VALUE_EDITED,
+    TEST_VALID_DATE, TEST_VALID_DATE_2
+)
 from .mixins import (
     DocumentMetadataMixin, DocumentMetadataViewTestMixin,
     MetadataTypeTestMixin, MetadataTypeViewTestMixin
@@ -791,6 +794,50 @@ class DocumentMetadataViewTestCase(
             self.test_documents[1].metadata.first().value, TEST_METADATA_VALUE_EDITED
         )
 
+    def test_multiple_document_metadata_edit_unchanged_joined_value(self):
+        # The bulk edit form shows a comma joined string of the distinct
+        # values across the selected documents. The synthetic joined
+        # string was never stored and must not bypass validation when
+        # submitted unchanged.
+        self.test_metadata_type.validation = TEST_DATE_VALIDATOR
+        self.test_metadata_type.save()
+
+        self._create_test_document_stub()
+
+        self.grant_permission(permission=permission_document_view)
+        self.grant_permission(permission=permission_document_metadata_edit)
+
+        self.test_documents[0].metadata.create(
+            metadata_type=self.test_metadata_type, value=TEST_VALID_DATE
+        )
+        self.test_documents[1].metadata.create(
+            metadata_type=self.test_metadata_type, value=TEST_VALID_DATE_2
+        )
+
+        response = self.post(
+            viewname='metadata:metadata_multiple_edit', data={
+                'id_list': '{},{}'.format(
+                    self.test_documents[0].pk, self.test_documents[1].pk
+                ),
+                'form-0-metadata_type_id': self.test_metadata_type.pk,
+                'form-0-update': True,
+                'form-0-value': '{}, {}'.format(
+                    TEST_VALID_DATE, TEST_VALID_DATE_2
+                ),
+                'form-TOTAL_FORMS': '1',
+                'form-INITIAL_FORMS': '0',
+                'form-MAX_NUM_FORMS': '',
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(
+            self.test_documents[0].metadata.first().value, TEST_VALID_DATE
+        )
+        self.assertEqual(
+            self.test_documents[1].metadata.first().value, TEST_VALID_DATE_2
+        )
+
 
 class DocumentMetadataRequiredTestCase(
     DocumentMetadataViewTestMixin, MetadataTypeTestMixin,
@@ -1015,6 +1062,27 @@ class DocumentTypeMetadataTypeViewTestCase(
             ], transform=dict
         )
 
+    def test_document_type_relationship_view_required_adds_metadata_to_existing_documents(self):
+        self._create_test_metadata_type()
+        self._create_test_document_stub()
+
+        self.grant_access(
+            obj=self.test_document_type, permission=permission_document_type_edit
+        )
+        self.grant_access(
+            obj=self.test_metadata_type,
+            permission=permission_metadata_type_edit
+        )
+
+        response = self._request_test_document_type_relationship_edit_view()
+        self.assertEqual(response.status_code, 302)
+
+        self.assertTrue(
+            self.test_document.metadata.filter(
+                metadata_type=self.test_metadata_type
+            ).exists()
+        )
+
 
 class MetadataTypeViewTestCase(
     MetadataTypeViewTestMixin, MetadataTypeTestMixin, GenericViewTestCase
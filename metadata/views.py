@@ -270,7 +270,7 @@ class DocumentMetadataEditView(
 
         for document in queryset:
             document_metadata_queryset = AccessControlList.objects.restrict_queryset(
-                queryset=document.metadata.all(),
+                queryset=document.metadata.select_related('metadata_type'),
                 permission=permission_document_metadata_edit,
                 user=self.request.user
             )
@@ -289,6 +289,10 @@ class DocumentMetadataEditView(
                 'document_type': document.document_type,
                 'metadata_type': key,
                 'value': ', '.join(value) if value else '',
+                # A single distinct value is a genuine stored value; the
+                # joined string of several distinct values is synthetic
+                # and was never stored or validated.
+                'value_is_stored': len(value) == 1,
             })
 
         return initial
@@ -433,7 +437,7 @@ class DocumentMetadataRemoveView(
         metadata = {}
         for document in queryset:
             document_metadata_queryset = AccessControlList.objects.restrict_queryset(
-                queryset=document.metadata.all(),
+                queryset=document.metadata.select_related('metadata_type'),
                 permission=permission_document_metadata_remove,
                 user=self.request.user
             )
@@ -592,8 +596,7 @@ class SetupDocumentTypeMetadataTypes(FormView):
 
     def form_valid(self, form):
         try:
-            for instance in form:
-                instance.save()
+            form.save()
         except Exception as exception:
             messages.error(
                 message=_(
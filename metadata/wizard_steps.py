@@ -33,7 +33,7 @@ class WizardStepMetadata(WizardStep):
         step_data = wizard.get_cleaned_data_for_step(WizardStepDocumentType.name)
         if step_data:
             document_type = step_data['document_type']
-            for document_type_metadata_type in document_type.metadata.all():
+            for document_type_metadata_type in document_type.metadata.select_related('metadata_type'):
                 initial.append(
                     {
                         'document_type': document_type,